@@ -1,9 +1,11 @@
 import os
-import math
 import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
-from sklearn.metrics import mean_squared_error
 
 # ---------- Configuration ----------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -27,9 +29,34 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("stock-lstm-app")
 
+# Use orjson for (de)serialization when available — large predicted/actual
+# arrays encode several times faster than with stdlib json. Falls back
+# silently to Flask's default provider.
+try:
+    import orjson
+    from flask.json.provider import JSONProvider
+
+    class OrjsonProvider(JSONProvider):
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj)
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+except ImportError:
+    logger.info("orjson not installed; using stdlib json for responses")
+
 # Try to import model utilities; provide a clear error if missing
 try:
-    from model_utils import train_model_for_ticker, fetch_stock, model_filepath_for_ticker
+    from model_utils import (
+        train_model_for_ticker,
+        fetch_stock,
+        model_filepath_for_ticker,
+        keras_filepath_for_ticker,
+        scaler_filepath_for_ticker,
+        tflite_filepath_for_ticker,
+    )
 except Exception as exc:
     logger.exception("Failed to import model_utils. Ensure model_utils.py exists and is importable.")
     # Keep placeholders so server still starts but endpoints will return an explanatory error
@@ -42,6 +69,58 @@ except Exception as exc:
     def model_filepath_for_ticker(ticker):
         raise RuntimeError("model_utils import failed: " + str(exc))
 
+    def keras_filepath_for_ticker(ticker):
+        raise RuntimeError("model_utils import failed: " + str(exc))
+
+    def scaler_filepath_for_ticker(ticker):
+        raise RuntimeError("model_utils import failed: " + str(exc))
+
+    def tflite_filepath_for_ticker(ticker):
+        raise RuntimeError("model_utils import failed: " + str(exc))
+
+
+# ---------- Background training queue ----------
+# Training can take minutes; /api/train queues it on a small worker pool and
+# returns a job id immediately instead of holding the HTTP connection open.
+_TRAIN_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("TRAIN_WORKERS", "2")))
+_TRAIN_JOBS = {}
+_TRAIN_JOBS_LOCK = threading.Lock()
+# finished/failed jobs are kept this long for polling, then pruned so the
+# job dict doesn't grow for the life of the process
+_TRAIN_JOBS_TTL = 3600  # seconds
+
+
+def _prune_train_jobs_locked():
+    """Drop terminal jobs past the TTL. Callers hold _TRAIN_JOBS_LOCK."""
+    cutoff = time.time() - _TRAIN_JOBS_TTL
+    stale = [
+        job_id for job_id, job in _TRAIN_JOBS.items()
+        if job.get("status") in ("done", "failed") and job.get("finished_at", 0) < cutoff
+    ]
+    for job_id in stale:
+        del _TRAIN_JOBS[job_id]
+
+
+def _run_train_job(job_id, params):
+    with _TRAIN_JOBS_LOCK:
+        _TRAIN_JOBS[job_id]["status"] = "running"
+    try:
+        result = train_model_for_ticker(**params)
+        import numpy as _np
+        preds = _np.asarray(result["preds"], dtype=_np.float32).ravel()
+        actuals = _np.asarray(result["actuals"], dtype=_np.float32).ravel()
+        rmse = float(_np.sqrt(_np.mean((preds - actuals) ** 2)))
+        update = {"status": "done", "rmse": rmse, "finished_at": time.time()}
+        model_path = keras_filepath_for_ticker(params["ticker"])
+        if os.path.exists(model_path):
+            update["model_path"] = model_path
+        with _TRAIN_JOBS_LOCK:
+            _TRAIN_JOBS[job_id].update(update)
+    except Exception as e:
+        logger.exception("Training job %s failed", job_id)
+        with _TRAIN_JOBS_LOCK:
+            _TRAIN_JOBS[job_id].update({"status": "failed", "error": str(e), "finished_at": time.time()})
+
 
 # ---------- Routes ----------
 @app.route("/", methods=["GET"])
@@ -59,12 +138,103 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+def _predict_single(ticker, start, end, lookback, epochs, batch_size, future_days, force_retrain):
+    """
+    Run the fetch/train/predict pipeline for one ticker.
+    Returns (response dict, http status) so /api/predict can serve it
+    directly or fold it into a batch response.
+    """
+    # Validate we can fetch data for this ticker/date range
+    try:
+        df_check = fetch_stock(ticker, start, end)
+        if df_check is None or df_check.empty or len(df_check) < (lookback + 10):
+            return {"error": "Not enough data for given lookback / date range."}, 400
+    except Exception as e:
+        logger.exception("Failed to fetch data for validation")
+        return {"error": f"Failed to fetch data for {ticker}: {str(e)}"}, 400
+
+    logger.info(
+        "Predict request: ticker=%s start=%s end=%s lookback=%d epochs=%d future_days=%d force_retrain=%s",
+        ticker, start, end, lookback, epochs, future_days, force_retrain
+    )
+
+    # Train (or load saved) model and produce predictions
+    try:
+        result = train_model_for_ticker(
+            ticker=ticker,
+            start=start,
+            end=end,
+            lookback=lookback,
+            epochs=epochs,
+            batch_size=batch_size,
+            future_days=future_days,
+            force_retrain=force_retrain,
+        )
+    except RuntimeError as rexc:
+        logger.exception("Model utilities runtime error")
+        return {"error": "Model utilities failed", "details": str(rexc)}, 500
+    except Exception as e:
+        logger.exception("Unhandled exception while training/loading model")
+        return {"error": "Model training/loading failed", "details": str(e)}, 500
+
+    # Expecting numpy arrays / lists in result
+    preds = result.get("preds")
+    actuals = result.get("actuals")
+    dates = result.get("dates")
+
+    if preds is None or actuals is None or dates is None:
+        logger.error("Model returned incomplete result: %s", result.keys())
+        return {"error": "Model failed to return predictions."}, 500
+
+    # Convert to Python lists and compute RMSE defensively
+    try:
+        import numpy as _np
+        preds_arr = _np.asarray(preds, dtype=_np.float32).ravel()
+        actuals_arr = _np.asarray(actuals, dtype=_np.float32).ravel()
+        # Fused single-pass RMSE on the arrays; no sklearn re-validation
+        rmse = float(_np.sqrt(_np.mean((preds_arr - actuals_arr) ** 2)))
+        preds_list = preds_arr.tolist()
+        actuals_list = actuals_arr.tolist()
+    except Exception as e:
+        logger.exception("Failed to compute metrics")
+        return {"error": "Failed to compute evaluation metrics", "details": str(e)}, 500
+
+    resp = {
+        "ticker": ticker,
+        "dates": dates,
+        "predicted": preds_list,
+        "actual": actuals_list,
+        "rmse": float(rmse),
+    }
+
+    if "future_preds" in result:
+        try:
+            future_preds = result.get("future_preds")
+            future_dates = result.get("future_dates", [])
+            resp["future_preds"] = _np.asarray(future_preds).ravel().tolist()
+            resp["future_dates"] = future_dates
+        except Exception:
+            # don't fail the whole request for future preds formatting problems
+            logger.exception("Failed to include future predictions in response")
+
+    # Also include model path (useful for debugging; optional)
+    try:
+        for model_path in (keras_filepath_for_ticker(ticker), model_filepath_for_ticker(ticker)):
+            if model_path and os.path.exists(model_path):
+                resp["model_path"] = model_path
+                break
+    except Exception:
+        logger.debug("Could not determine model path for ticker %s", ticker)
+
+    return resp, 200
+
+
 @app.route("/api/predict", methods=["POST"])
 def predict():
     """
     Expects JSON:
     {
-      "ticker": "AAPL",
+      "ticker": "AAPL",        # or "tickers": ["AAPL", "TSLA"] for a batch
       "start": "2018-01-01",
       "end": "2024-01-01",
       "lookback": 60,
@@ -73,6 +243,7 @@ def predict():
       "future_days": 30,       # optional
       "force_retrain": false   # optional
     }
+    Batch requests return {"results": {ticker: <single response or error>}}.
     """
     try:
         # Safe JSON parsing
@@ -80,9 +251,15 @@ def predict():
         if payload is None:
             return jsonify({"error": "Invalid or missing JSON payload."}), 400
 
-        ticker = payload.get("ticker", "AAPL")
-        if ticker:
-            ticker = str(ticker).upper().strip()
+        # single ticker or a batch in one call
+        batch = "tickers" in payload
+        if batch:
+            tickers = payload.get("tickers")
+            if not isinstance(tickers, (list, tuple)) or not tickers:
+                return jsonify({"error": "tickers must be a non-empty list."}), 400
+            tickers = [str(t).upper().strip() for t in tickers]
+        else:
+            tickers = [str(payload.get("ticker", "AAPL")).upper().strip()]
 
         start = payload.get("start")
         end = payload.get("end")
@@ -101,106 +278,94 @@ def predict():
         if not start or not end:
             return jsonify({"error": "start and end dates required (YYYY-MM-DD)"}), 400
 
-        # Validate we can fetch data for this ticker/date range
-        try:
-            df_check = fetch_stock(ticker, start, end)
-            if df_check is None or df_check.empty or len(df_check) < (lookback + 10):
-                return jsonify({"error": "Not enough data for given lookback / date range."}), 400
-        except Exception as e:
-            logger.exception("Failed to fetch data for validation")
-            return jsonify({"error": f"Failed to fetch data for {ticker}: {str(e)}"}), 400
-
-        logger.info(
-            "Predict request: ticker=%s start=%s end=%s lookback=%d epochs=%d future_days=%d force_retrain=%s",
-            ticker, start, end, lookback, epochs, future_days, force_retrain
-        )
-
-        # Train (or load saved) model and produce predictions
-        try:
-            result = train_model_for_ticker(
-                ticker=ticker,
-                start=start,
-                end=end,
-                lookback=lookback,
-                epochs=epochs,
-                batch_size=batch_size,
-                future_days=future_days,
-                force_retrain=force_retrain,
+        if not batch:
+            resp, status = _predict_single(
+                tickers[0], start, end, lookback, epochs, batch_size, future_days, force_retrain
             )
-        except RuntimeError as rexc:
-            logger.exception("Model utilities runtime error")
-            return jsonify({"error": "Model utilities failed", "details": str(rexc)}), 500
-        except Exception as e:
-            logger.exception("Unhandled exception while training/loading model")
-            return jsonify({"error": "Model training/loading failed", "details": str(e)}), 500
-
-        # Expecting numpy arrays / lists in result
-        preds = result.get("preds")
-        actuals = result.get("actuals")
-        dates = result.get("dates")
-
-        if preds is None or actuals is None or dates is None:
-            logger.error("Model returned incomplete result: %s", result.keys())
-            return jsonify({"error": "Model failed to return predictions."}), 500
-
-        # Convert to Python lists and compute RMSE defensively
-        try:
-            # If preds/actuals are numpy arrays, cast them to lists
-            import numpy as _np
-            if hasattr(preds, "tolist"):
-                preds_list = _np.asarray(preds).ravel().tolist()
-            else:
-                preds_list = list(preds)
-
-            if hasattr(actuals, "tolist"):
-                actuals_list = _np.asarray(actuals).ravel().tolist()
-            else:
-                actuals_list = list(actuals)
-
-            rmse = math.sqrt(mean_squared_error(actuals_list, preds_list))
-        except Exception as e:
-            logger.exception("Failed to compute metrics")
-            return jsonify({"error": "Failed to compute evaluation metrics", "details": str(e)}), 500
-
-        resp = {
-            "ticker": ticker,
-            "dates": dates,
-            "predicted": [float(x) for x in preds_list],
-            "actual": [float(x) for x in actuals_list],
-            "rmse": float(rmse),
-        }
-
-        if "future_preds" in result:
-            try:
-                future_preds = result.get("future_preds")
-                future_dates = result.get("future_dates", [])
-                if hasattr(future_preds, "tolist"):
-                    future_preds = _np.asarray(future_preds).ravel().tolist()
-                resp["future_preds"] = [float(x) for x in future_preds]
-                resp["future_dates"] = future_dates
-            except Exception:
-                # don't fail the whole request for future preds formatting problems
-                logger.exception("Failed to include future predictions in response")
-
-        # Also include model path (useful for debugging; optional)
-        try:
-            model_path = model_filepath_for_ticker(ticker)
-            if model_path and os.path.exists(model_path):
-                resp["model_path"] = model_path
-        except Exception:
-            logger.debug("Could not determine model path for ticker %s", ticker)
-
-        return jsonify(resp), 200
+            return jsonify(resp), status
+
+        # batch: fan out across tickers on a bounded pool — the per-ticker
+        # train locks make concurrent pipelines safe — and collect one
+        # response per ticker; individual failures don't fail the call
+        results = {}
+        with ThreadPoolExecutor(max_workers=min(8, len(tickers))) as pool:
+            futures = {
+                pool.submit(
+                    _predict_single,
+                    ticker, start, end, lookback, epochs, batch_size, future_days, force_retrain,
+                ): ticker
+                for ticker in tickers
+            }
+            for fut, ticker in futures.items():
+                resp, status = fut.result()
+                if status != 200:
+                    resp = dict(resp, status=status)
+                results[ticker] = resp
+        return jsonify({"results": results}), 200
 
     except Exception as e:
         logger.exception("Unhandled exception in /api/predict")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 
+@app.route("/api/train", methods=["POST"])
+def train_async():
+    """
+    Queue a training run in the background and return a job id.
+    Expects the same JSON as /api/predict (ticker, start, end, lookback,
+    epochs, batch_size, force_retrain). Poll /api/train_status/<job_id>.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        if payload is None:
+            return jsonify({"error": "Invalid or missing JSON payload."}), 400
+
+        ticker = str(payload.get("ticker", "AAPL")).upper().strip()
+        start = payload.get("start")
+        end = payload.get("end")
+        if not start or not end:
+            return jsonify({"error": "start and end dates required (YYYY-MM-DD)"}), 400
+
+        try:
+            params = {
+                "ticker": ticker,
+                "start": start,
+                "end": end,
+                "lookback": int(payload.get("lookback", 60)),
+                "epochs": int(payload.get("epochs", 10)),
+                "batch_size": int(payload.get("batch_size", 32)),
+                "future_days": 0,
+                "force_retrain": bool(payload.get("force_retrain", False)),
+            }
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid numeric parameters (lookback, epochs, batch_size)."}), 400
+
+        job_id = uuid.uuid4().hex
+        with _TRAIN_JOBS_LOCK:
+            _prune_train_jobs_locked()
+            _TRAIN_JOBS[job_id] = {"status": "queued", "ticker": ticker}
+        _TRAIN_EXECUTOR.submit(_run_train_job, job_id, params)
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+    except Exception as e:
+        logger.exception("Unhandled exception in /api/train")
+        return jsonify({"error": "Internal server error", "details": str(e)}), 500
+
+
+@app.route("/api/train_status/<job_id>", methods=["GET"])
+def train_status(job_id):
+    """Return the status (and result, once done) of a queued training job."""
+    with _TRAIN_JOBS_LOCK:
+        job = _TRAIN_JOBS.get(job_id)
+        if job is None:
+            return jsonify({"error": "unknown job id", "job_id": job_id}), 404
+        return jsonify(dict(job, job_id=job_id)), 200
+
+
 @app.route("/api/models", methods=["GET"])
 def list_models():
     """
-    Optional helper endpoint to list available saved models (models/*.h5).
+    Optional helper endpoint to list available saved models
+    (models/*.keras and legacy models/*.h5 files).
     Returns list of {"ticker":..., "path":...}
     """
     try:
@@ -208,9 +373,10 @@ def list_models():
         models = []
         if os.path.exists(MODELS_DIR):
             for fname in os.listdir(MODELS_DIR):
-                if fname.lower().endswith(".h5"):
+                path = os.path.join(MODELS_DIR, fname)
+                if fname.lower().endswith((".keras", ".h5")):
                     ticker = os.path.splitext(fname)[0]
-                    models.append({"ticker": ticker, "path": os.path.join(MODELS_DIR, fname)})
+                    models.append({"ticker": ticker, "path": path})
         return jsonify({"models": models}), 200
     except Exception as e:
         logger.exception("Error listing models")
@@ -231,10 +397,25 @@ def delete_model():
         if not ticker:
             return jsonify({"error": "ticker required"}), 400
 
+        deleted = []
+        keras_path = keras_filepath_for_ticker(ticker)
+        if os.path.exists(keras_path):
+            os.remove(keras_path)
+            deleted.append(keras_path)
         path = model_filepath_for_ticker(ticker)
         if os.path.exists(path):
             os.remove(path)
-            return jsonify({"deleted": path}), 200
+            deleted.append(path)
+        tflite_path = tflite_filepath_for_ticker(ticker)
+        if os.path.exists(tflite_path):
+            os.remove(tflite_path)
+            deleted.append(tflite_path)
+        scaler_path = scaler_filepath_for_ticker(ticker)
+        if deleted and os.path.exists(scaler_path):
+            os.remove(scaler_path)
+            deleted.append(scaler_path)
+        if deleted:
+            return jsonify({"deleted": deleted}), 200
         else:
             return jsonify({"error": "model not found", "path": path}), 404
     except Exception as e:
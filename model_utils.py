@@ -1,64 +1,354 @@
 # model_utils.py
 import os
+import time
+import pickle
+import threading
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
+import tensorflow as tf
 from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import LSTM, Dense, Dropout
 from tensorflow.keras.callbacks import EarlyStopping
 import yfinance as yf
 
+# Mixed precision (fp16 compute, fp32 variables) roughly doubles LSTM
+# throughput on tensor-core GPUs. Only enabled when a GPU is visible;
+# mixed_float16 is slower on CPU.
+try:
+    if tf.config.list_physical_devices('GPU'):
+        tf.keras.mixed_precision.set_global_policy('mixed_float16')
+except Exception as e:
+    print("Warning: could not enable mixed precision:", e)
+
 MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
 os.makedirs(MODELS_DIR, exist_ok=True)
 
+# In-process cache of loaded models: ticker -> (file mtime, model).
+# Avoids re-reading the HDF5 file and rebuilding the Keras graph on every
+# warm request; invalidated automatically when the file on disk changes.
+# Guarded by a lock: predict requests fan out across threads.
+_MODEL_CACHE = {}
+_MODEL_CACHE_MAX = 32
+_MODEL_CACHE_LOCK = threading.Lock()
+
+# One lock per ticker so concurrent requests for the same ticker train
+# once instead of racing; waiters pick up the freshly saved model.
+_TRAIN_LOCKS = {}
+_TRAIN_LOCKS_GUARD = threading.Lock()
+
+def _train_lock_for(ticker):
+    with _TRAIN_LOCKS_GUARD:
+        lock = _TRAIN_LOCKS.get(ticker)
+        if lock is None:
+            lock = _TRAIN_LOCKS[ticker] = threading.Lock()
+        return lock
+
+# Downloaded price data cache: in-memory dict of (fetch time, frame) backed
+# by pickled frames on disk, so repeated requests for the same ticker/range
+# skip the yfinance network round-trip. Both layers honour the same TTL, and
+# the dict is lock-guarded since batch requests fetch from multiple threads.
+DATA_CACHE_DIR = os.path.join(os.path.dirname(__file__), "data_cache")
+os.makedirs(DATA_CACHE_DIR, exist_ok=True)
+_FETCH_CACHE = {}
+_FETCH_CACHE_MAX = 64
+_FETCH_CACHE_TTL = 24 * 3600  # seconds
+_FETCH_CACHE_LOCK = threading.Lock()
+
+def _fetch_cache_path(ticker, start, end):
+    safe = ticker.upper().replace("/", "_")
+    return os.path.join(DATA_CACHE_DIR, f"{safe}_{start}_{end}.pkl")
+
 def fetch_stock(ticker, start, end):
-    df = yf.download(ticker, start=start, end=end, progress=False)
-    if df.empty:
-        raise ValueError(f"No data for {ticker} in range {start} to {end}")
-    df = df[['Close']].reset_index()
-    df['Date'] = pd.to_datetime(df['Date'])
-    return df
+    key = (str(ticker).upper(), str(start), str(end))
+    now = time.time()
+    with _FETCH_CACHE_LOCK:
+        cached = _FETCH_CACHE.get(key)
+        if cached is not None:
+            fetched_at, df = cached
+            if now - fetched_at < _FETCH_CACHE_TTL:
+                return df.copy()
+            # expired: drop it and fall through to disk/network
+            _FETCH_CACHE.pop(key, None)
+
+    cache_path = _fetch_cache_path(*key)
+    df = None
+    fetched_at = now
+    if os.path.exists(cache_path) and (now - os.path.getmtime(cache_path)) < _FETCH_CACHE_TTL:
+        try:
+            df = pd.read_pickle(cache_path)
+            fetched_at = os.path.getmtime(cache_path)
+        except Exception as e:
+            print("Warning: failed to read cached data:", e)
+            df = None
+
+    if df is None:
+        # yfinance >= 0.2.54 manages its own pooled curl_cffi session and
+        # rejects a plain requests.Session, so connection reuse across
+        # downloads comes for free
+        df = yf.download(ticker, start=start, end=end, progress=False)
+        if df.empty:
+            raise ValueError(f"No data for {ticker} in range {start} to {end}")
+        df = df[['Close']].reset_index()
+        df['Date'] = pd.to_datetime(df['Date'])
+        try:
+            df.to_pickle(cache_path)
+        except Exception as e:
+            print("Warning: failed to write data cache:", e)
+
+    with _FETCH_CACHE_LOCK:
+        while len(_FETCH_CACHE) >= _FETCH_CACHE_MAX:
+            _FETCH_CACHE.pop(next(iter(_FETCH_CACHE)))
+        _FETCH_CACHE[key] = (fetched_at, df)
+    return df.copy()
+
+# numba is optional: when present the scaling loop is JIT-compiled,
+# otherwise we fall back to the equivalent numpy expression
+try:
+    from numba import njit, prange
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+if _HAS_NUMBA:
+    @njit(cache=True, fastmath=True)
+    def _minmax_scale(series, lo, span, out):
+        for i in range(series.shape[0]):
+            out[i] = (series[i] - lo) / span
+
+    @njit(cache=True, parallel=True)
+    def _fill_sequences(series, lookback, X, y):
+        # threads split the windows; each row is an independent copy
+        for i in prange(X.shape[0]):
+            for j in range(lookback):
+                X[i, j, 0] = series[i + j]
+            y[i] = series[i + lookback]
+
+class SeriesScaler:
+    """Minimal fitted (0, 1) min-max scaler state. Exposes the same
+    data_min_/data_max_ attributes the rest of the module reads, without
+    sklearn's per-call validation, and is cheap to pickle."""
+    def __init__(self, data_min, data_max):
+        self.data_min_ = np.array([data_min], dtype=np.float32)
+        self.data_max_ = np.array([data_max], dtype=np.float32)
 
 def scale_series(series):
-    scaler = MinMaxScaler(feature_range=(0, 1))
-    shaped = series.reshape(-1, 1)
-    scaled = scaler.fit_transform(shaped)
-    return scaled, scaler
+    series = np.ascontiguousarray(np.asarray(series, dtype=np.float32).ravel())
+    lo = float(series.min())
+    hi = float(series.max())
+    span = (hi - lo) or 1.0
+    scaled = np.empty((series.shape[0], 1), dtype=np.float32)
+    if _HAS_NUMBA:
+        _minmax_scale(series, lo, span, scaled[:, 0])
+    else:
+        scaled[:, 0] = (series - lo) / span
+    return scaled, SeriesScaler(lo, hi)
+
+def apply_scale(scaler, series):
+    # forward transform with an already-fitted scaler (no refit)
+    series = np.asarray(series, dtype=np.float32).ravel()
+    lo = float(scaler.data_min_[0])
+    span = (float(scaler.data_max_[0]) - lo) or 1.0
+    return ((series - lo) / span).reshape(-1, 1)
+
+def inverse_scale(scaler, values):
+    # Fused equivalent of scaler.inverse_transform without the reshape,
+    # input validation and copy sklearn does: x * (max - min) + min
+    values = np.asarray(values, dtype=np.float32).ravel()
+    span = float(scaler.data_max_[0]) - float(scaler.data_min_[0])
+    return values * span + float(scaler.data_min_[0])
 
 def create_sequences(data, lookback=60):
-    X, y = [], []
-    for i in range(lookback, len(data)):
-        X.append(data[i-lookback:i, 0])
-        y.append(data[i, 0])
-    X, y = np.array(X), np.array(y)
-    X = X.reshape((X.shape[0], X.shape[1], 1))
+    # Build all windows as a strided view and materialize them with one
+    # contiguous copy instead of appending row-by-row in Python.
+    series = np.ascontiguousarray(data[:, 0], dtype=np.float32)
+    if len(series) <= lookback:
+        return np.empty((0, lookback, 1), dtype=np.float32), np.empty(0, dtype=np.float32)
+    n = len(series) - lookback
+    if _HAS_NUMBA:
+        # parallel fill: windows are copied by independent threads, which
+        # pays off on the long multi-year histories pretrain.py feeds in
+        X = np.empty((n, lookback, 1), dtype=np.float32)
+        y = np.empty(n, dtype=np.float32)
+        _fill_sequences(series, lookback, X, y)
+        return X, y
+    windows = np.lib.stride_tricks.sliding_window_view(series, lookback)[:-1]
+    X = windows[:, :, None].astype(np.float32, copy=True)
+    y = series[lookback:].astype(np.float32, copy=True)
     return X, y
 
 def build_lstm(input_shape, units=64, dropout=0.2):
+    # Single LSTM layer with stock activations/no recurrent_dropout so Keras
+    # can dispatch to the fused CuDNN kernel on GPU; the old two-layer stack
+    # roughly doubled step time for little accuracy gain on one feature.
     model = Sequential()
-    model.add(LSTM(units, return_sequences=True, input_shape=input_shape))
-    model.add(Dropout(dropout))
-    model.add(LSTM(max(8, units // 2)))
+    model.add(LSTM(units, input_shape=input_shape))
     model.add(Dropout(dropout))
-    model.add(Dense(1))
+    # keep the output head in float32 so predictions stay numerically
+    # stable under the mixed-precision policy
+    model.add(Dense(1, dtype='float32'))
     model.compile(optimizer='adam', loss='mean_squared_error')
     return model
 
 def model_filepath_for_ticker(ticker):
+    # legacy HDF5 location; new models are saved in the native .keras format
     safe = ticker.upper().replace("/", "_")
     return os.path.join(MODELS_DIR, f"{safe}.h5")
 
+def keras_filepath_for_ticker(ticker):
+    safe = ticker.upper().replace("/", "_")
+    return os.path.join(MODELS_DIR, f"{safe}.keras")
+
 def save_model_for_ticker(model, ticker):
-    path = model_filepath_for_ticker(ticker)
+    # native .keras format: loads faster than HDF5 and, unlike an
+    # extension-less SavedModel path, is accepted by Keras 3's model.save
+    path = keras_filepath_for_ticker(ticker)
     model.save(path)
+    # drop any stale cached copy; next load picks up the new file
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE.pop(ticker, None)
+    return path
+
+def scaler_filepath_for_ticker(ticker):
+    safe = ticker.upper().replace("/", "_")
+    return os.path.join(MODELS_DIR, f"{safe}_scaler.pkl")
+
+def save_scaler_for_ticker(scaler, ticker):
+    path = scaler_filepath_for_ticker(ticker)
+    with open(path, "wb") as f:
+        pickle.dump(scaler, f)
     return path
 
+def load_saved_scaler(ticker):
+    path = scaler_filepath_for_ticker(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print("Warning: failed to load saved scaler:", e)
+        return None
+
+def tflite_filepath_for_ticker(ticker):
+    safe = ticker.upper().replace("/", "_")
+    return os.path.join(MODELS_DIR, f"{safe}.tflite")
+
+def export_tflite_for_ticker(ticker, model=None):
+    """
+    Export the ticker's model as a dynamic-range quantized TFLite flatbuffer
+    (int8 weights, float activations) for CPU-only deployments. Returns the
+    written path.
+    """
+    if model is None:
+        model = load_saved_model(ticker)
+    if model is None:
+        raise ValueError(f"No saved model for {ticker}")
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    # LSTM kernels are not all TFLite builtins; allow the select-TF fallback
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS,
+        tf.lite.OpsSet.SELECT_TF_OPS,
+    ]
+    path = tflite_filepath_for_ticker(ticker)
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+    return path
+
+# Opt-in TFLite serving: with USE_TFLITE=1, tickers that have a quantized
+# flatbuffer (pretrain.py --export-tflite) are served through the XNNPACK
+# interpreter instead of the full Keras runtime — the win on CPU-only hosts.
+_USE_TFLITE = os.environ.get("USE_TFLITE", "0") == "1"
+
+class _TFLiteModel:
+    """Interpreter-backed drop-in for model(X, training=False)."""
+    def __init__(self, path):
+        self._interpreter = tf.lite.Interpreter(model_path=path)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        # TFLite interpreters are not thread-safe, and this wrapper is
+        # shared through the model cache — serialize invocations
+        self._lock = threading.Lock()
+
+    def __call__(self, X, training=False):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        with self._lock:
+            if tuple(self._input['shape']) != X.shape:
+                self._interpreter.resize_tensor_input(self._input['index'], X.shape)
+                self._interpreter.allocate_tensors()
+            self._interpreter.set_tensor(self._input['index'], X)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output['index'])
+
 def load_saved_model(ticker):
-    path = model_filepath_for_ticker(ticker)
-    if os.path.exists(path):
-        # silent load
-        return load_model(path)
-    return None
+    path = None
+    if _USE_TFLITE:
+        tflite_path = tflite_filepath_for_ticker(ticker)
+        if os.path.exists(tflite_path):
+            # a flatbuffer older than the Keras model is stale (e.g. after a
+            # force_retrain without re-export) — fall back to Keras then
+            keras_path = keras_filepath_for_ticker(ticker)
+            if not os.path.exists(keras_path) or os.path.getmtime(tflite_path) >= os.path.getmtime(keras_path):
+                path = tflite_path
+    if path is None:
+        path = keras_filepath_for_ticker(ticker)
+        if not os.path.exists(path):
+            # fall back to a pre-existing HDF5 model
+            path = model_filepath_for_ticker(ticker)
+            if not os.path.exists(path):
+                return None
+    mtime = os.path.getmtime(path)
+    with _MODEL_CACHE_LOCK:
+        cached = _MODEL_CACHE.get(ticker)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    if path.endswith(".tflite"):
+        model = _TFLiteModel(path)
+    else:
+        # compile=False: we only predict with loaded models, so skip
+        # rebuilding the optimizer state
+        model = load_model(path, compile=False)
+    with _MODEL_CACHE_LOCK:
+        while len(_MODEL_CACHE) >= _MODEL_CACHE_MAX:
+            # evict the oldest entry (insertion order) to cap memory use
+            _MODEL_CACHE.pop(next(iter(_MODEL_CACHE)))
+        _MODEL_CACHE[ticker] = (mtime, model)
+    return model
+
+def _train_new_model(X_train, y_train, X_test, y_test, epochs, batch_size, ticker, scaler=None):
+    """Build, fit and save a fresh model. Callers hold the ticker's train lock."""
+    model = build_lstm((X_train.shape[1], 1))
+    es = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True, verbose=0)
+    # tf.data pipeline: cache the slices once, shuffle per epoch (same as
+    # fit's default) and prefetch batches so input prep overlaps training
+    train_ds = (
+        tf.data.Dataset.from_tensor_slices((X_train, y_train))
+        .cache()
+        .shuffle(len(X_train))
+        .batch(batch_size)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    val_ds = (
+        tf.data.Dataset.from_tensor_slices((X_test, y_test))
+        .batch(batch_size)
+        .cache()
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=epochs,
+        callbacks=[es],
+        verbose=1
+    )
+    # save the trained model (and the scaler it was fitted with) for future
+    # use; let persistence failures propagate — silently dropping them turns
+    # the model cache, scaler reuse and pretraining into no-ops
+    save_model_for_ticker(model, ticker)
+    if scaler is not None:
+        save_scaler_for_ticker(scaler, ticker)
+    return model
 
 def train_model_for_ticker(ticker, start, end, lookback=60, epochs=10, batch_size=32, future_days=0, force_retrain=False):
     """
@@ -70,12 +360,23 @@ def train_model_for_ticker(ticker, start, end, lookback=60, epochs=10, batch_siz
       - dates (list of test-set dates)
       - future_preds/future_dates optional
     """
-    # Fetch historical data
+    # Fetch historical data; keep prices contiguous float32 from here on so
+    # no downstream step has to re-copy or re-cast
     df = fetch_stock(ticker, start, end)
-    prices = df['Close'].values.astype('float32')
+    prices = np.ascontiguousarray(df['Close'].values, dtype=np.float32)
+
+    model = None
+    if not force_retrain:
+        model = load_saved_model(ticker)
 
-    # scale
-    scaled, scaler = scale_series(prices)
+    # scale: when serving a saved model, reuse the scaler it was trained
+    # with so inputs are mapped exactly as at training time, instead of
+    # refitting min/max on whatever range this request happens to cover
+    scaler = load_saved_scaler(ticker) if model is not None else None
+    if scaler is not None:
+        scaled = apply_scale(scaler, prices)
+    else:
+        scaled, scaler = scale_series(prices)
 
     # sequences
     X, y = create_sequences(scaled, lookback=lookback)
@@ -87,32 +388,31 @@ def train_model_for_ticker(ticker, start, end, lookback=60, epochs=10, batch_siz
     X_train, X_test = X[:split_idx], X[split_idx:]
     y_train, y_test = y[:split_idx], y[split_idx:]
 
-    model = None
-    if not force_retrain:
-        model = load_saved_model(ticker)
-
     if model is None:
-        # build & train
-        model = build_lstm((X_train.shape[1], 1))
-        es = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True, verbose=0)
-        model.fit(
-            X_train, y_train,
-            validation_data=(X_test, y_test),
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=[es],
-            verbose=1
-        )
-        # save the trained model for future use
-        try:
-            save_model_for_ticker(model, ticker)
-        except Exception as e:
-            print("Warning: failed to save model:", e)
+        lock = _train_lock_for(ticker)
+        with lock:
+            # a concurrent request may have trained while we waited
+            if not force_retrain:
+                model = load_saved_model(ticker)
+                if model is not None:
+                    # rescale with the scaler that model was trained with,
+                    # not the one we fit before blocking on the lock
+                    saved_scaler = load_saved_scaler(ticker)
+                    if saved_scaler is not None:
+                        scaler = saved_scaler
+                        scaled = apply_scale(scaler, prices)
+                        X, y = create_sequences(scaled, lookback=lookback)
+                        X_test = X[split_idx:]
+                        y_test = y[split_idx:]
+            if model is None:
+                model = _train_new_model(X_train, y_train, X_test, y_test,
+                                         epochs, batch_size, ticker, scaler)
 
-    # Predict on test set
-    preds_scaled = model.predict(X_test).flatten()
-    preds = scaler.inverse_transform(preds_scaled.reshape(-1, 1)).flatten()
-    actuals = scaler.inverse_transform(y_test.reshape(-1, 1)).flatten()
+    # Predict on test set; direct call skips predict()'s progress bar,
+    # dataset construction and per-batch callback machinery
+    preds_scaled = np.asarray(model(X_test, training=False)).ravel()
+    preds = inverse_scale(scaler, preds_scaled)
+    actuals = inverse_scale(scaler, y_test)
 
     # Align test set dates
     test_dates = df['Date'].values[lookback + split_idx : lookback + split_idx + len(actuals)]
@@ -127,14 +427,18 @@ def train_model_for_ticker(ticker, start, end, lookback=60, epochs=10, batch_siz
 
     # Recursive future forecasting if requested
     if future_days and future_days > 0:
-        future_preds = []
-        last_window = scaled[-lookback:].reshape(1, lookback, 1).copy()
-        for _ in range(future_days):
-            next_scaled = model.predict(last_window).flatten()[0]
-            future_preds.append(next_scaled)
-            last_window = np.append(last_window[:,1:,:], [[[next_scaled]]], axis=1)
+        # Preallocate one ring buffer and shift it in place; calling the model
+        # directly (training=False) skips predict()'s per-call setup overhead.
+        future_preds = np.empty(future_days, dtype=np.float32)
+        buf = np.empty((1, lookback, 1), dtype=np.float32)
+        buf[0, :, 0] = scaled[-lookback:, 0]
+        for i in range(future_days):
+            next_scaled = float(np.asarray(model(buf, training=False))[0, 0])
+            future_preds[i] = next_scaled
+            buf[0, :-1, 0] = buf[0, 1:, 0]
+            buf[0, -1, 0] = next_scaled
         # inverse scale
-        future_preds_unscaled = scaler.inverse_transform(np.array(future_preds).reshape(-1,1)).flatten()
+        future_preds_unscaled = inverse_scale(scaler, future_preds)
         last_date = df['Date'].iloc[-1]
         future_dates = pd.bdate_range(start=last_date + pd.Timedelta(days=1), periods=future_days).strftime('%Y-%m-%d').tolist()
         result['future_preds'] = future_preds_unscaled